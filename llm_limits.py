@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+
+from traffic import record_llm_call
+from typing_status import reply_with_typing
+
+logger = logging.getLogger(__name__)
+
+# Ограничения нагрузки на модель
+LLM_MAX_ACTIVE = 8  # Сколько запросов к модели выполняется одновременно
+LLM_MAX_WAITING = 32  # Сколько запросов может ждать в очереди
+LLM_DEBOUNCE = 1.0  # Сколько секунд ждать следующего сообщения, чтобы объединить их
+
+BUSY_TEXT = "⏳ Сейчас много обращений. Пожалуйста, подождите минуту и повторите вопрос."
+
+
+class LLMBusyError(Exception):
+    """Очередь запросов к модели переполнена"""
+
+
+class LLMGate:
+    """Ограничивает число одновременных запросов к модели.
+
+    Не больше max_active запросов выполняются одновременно, еще max_waiting
+    ждут своей очереди. Остальные сразу получают LLMBusyError.
+
+        async with llm_gate:
+            answer = await get_answer(...)
+    """
+
+    def __init__(self, max_active, max_waiting):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._semaphore = None  # Создается внутри работающего event loop
+
+    def is_full(self):
+        """True, если новый запрос сразу получит отказ"""
+        return self._semaphore is not None and self._semaphore.locked() and self.waiting >= self.max_waiting
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_active)
+
+        if self._semaphore.locked():
+            if self.is_full():
+                logger.warning(f"Очередь к модели переполнена: {self.max_active} в работе, {self.waiting} ждут")
+                raise LLMBusyError()
+            self.waiting += 1
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+
+class ChatCoalescer:
+    """Объединяет сообщения, которые пользователь отправил подряд.
+
+    Первое сообщение пачки ждет, пока в течение window секунд не перестанут
+    приходить новые, и передает в handler их общий текст. Следующие сообщения
+    просто добавляются в пачку и получают None. Для одного чата handler
+    никогда не выполняется параллельно.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._batches = {}  # chat_id -> список сообщений, ожидающих отправки
+        self._locks = {}  # chat_id -> блокировка текущего запроса к модели
+
+    def is_collecting(self, chat_id):
+        """True, если сообщение чата присоединится к уже ожидающей пачке"""
+        return chat_id in self._batches
+
+    async def run(self, chat_id, text, handler):
+        batch = self._batches.get(chat_id)
+        if batch is not None:
+            batch.append(text)
+            return None
+
+        batch = self._batches[chat_id] = [text]
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        try:
+            async with lock:
+                # Пока идет предыдущий запрос и пока пользователь печатает, пачка открыта
+                seen = 0
+                while seen != len(batch):
+                    seen = len(batch)
+                    await asyncio.sleep(self.window)
+                del self._batches[chat_id]
+
+                if len(batch) > 1:
+                    logger.info(f"Объединено {len(batch)} сообщений чата {chat_id}")
+                return await handler("\n".join(batch))
+        finally:
+            if self._batches.get(chat_id) is batch:
+                del self._batches[chat_id]
+            if chat_id not in self._batches and not lock.locked():
+                self._locks.pop(chat_id, None)
+
+
+llm_gate = LLMGate(LLM_MAX_ACTIVE, LLM_MAX_WAITING)
+llm_coalescer = ChatCoalescer(LLM_DEBOUNCE)
+
+
+async def answer_free_text(chat, user_id, user_message, ask_llm):
+    """Отвечает на свободный текст через ask_llm(user_id, text) с учетом ограничений нагрузки.
+
+    Возвращает None, если сообщение присоединено к уже ожидающему запросу.
+    """
+    # При переполненной очереди отвечаем сразу, не дожидаясь окна объединения.
+    # Очередь может заполниться и за время окна — тогда отказ придет после него
+    if not llm_coalescer.is_collecting(user_id) and llm_gate.is_full():
+        return BUSY_TEXT
+
+    async def ask(text):
+        try:
+            async with llm_gate:
+                # Статус набора отсчитывается от начала запроса к модели, а не от окна объединения
+                started = time.perf_counter()
+                try:
+                    return await reply_with_typing(chat, ask_llm(user_id, text))
+                finally:
+                    record_llm_call(ask_llm.__name__, time.perf_counter() - started)
+        except LLMBusyError:
+            return BUSY_TEXT
+
+    return await llm_coalescer.run(user_id, user_message, ask)
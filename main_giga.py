@@ -1,18 +1,32 @@
+import asyncio
 import logging
+import time
+import uuid
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, MessageHandler, CommandHandler, filters, ContextTypes, CallbackQueryHandler
-from gigachat import GigaChat
 
+from llm_limits import answer_free_text
 from src import TELEGRAM_TOKEN, GIGACHAT_CREDENTIALS
+from traffic import build_application
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-giga = GigaChat(credentials=GIGACHAT_CREDENTIALS, verify_ssl_certs=False)
+# Клиент GigaChat создается при первом обращении к модели
+giga = None
+token_task = None  # Фоновая задача обновления токена GigaChat
 
 # Хранилище данных пользователей
 user_states = {}
 user_data = {}  # Для хранения собранных данных
+user_dialogs = {}  # Для хранения диалогов с GigaChat
+
+# Обновление токена доступа GigaChat (в секундах)
+TOKEN_REFRESH_MARGIN = 60  # За сколько до истечения обновлять токен
+TOKEN_RETRY_DELAY = 10  # Пауза перед повтором после ошибки
+
+# Сколько последних сообщений диалога передавать модели
+DIALOG_HISTORY_LIMIT = 20
 
 # ID менеджера для уведомлений (замените на реальный ID)
 MANAGER_CHAT_ID = 1791945909
@@ -36,6 +50,70 @@ SYSTEM_PROMPT = """Ты — AI-ассистент компании «ОСНОВ
 После сбора этих 3 пунктов - заявка готова."""
 
 
+def get_giga():
+    """Возвращает клиент GigaChat, импортируя SDK при первом вызове"""
+    global giga
+    if giga is None:
+        from gigachat import GigaChat
+        giga = GigaChat(credentials=GIGACHAT_CREDENTIALS, verify_ssl_certs=False)
+    return giga
+
+
+async def fetch_giga_token(client):
+    """Получает новый токен GigaChat и подставляет его в клиент только при успехе.
+
+    Работает с внутренностями gigachat==0.1.43 (_auth_aclient, _settings,
+    _access_token): эта версия SDK не проверяет срок действия токена и не умеет
+    обновлять его заранее. Старый токен остается в клиенте до самой замены,
+    поэтому запросы клиентов никогда не ждут OAuth.
+    """
+    from gigachat.api import post_auth
+
+    token = await post_auth.asyncio(
+        client._auth_aclient,
+        url=client._settings.auth_url,
+        credentials=client._settings.credentials,
+        scope=client._settings.scope,
+    )
+    client._access_token = token
+    return token
+
+
+async def update_giga_token():
+    """Обновляет токен GigaChat и возвращает паузу до следующего обновления"""
+    try:
+        started = time.perf_counter()
+        token = await fetch_giga_token(get_giga())
+        logger.info(f"Токен GigaChat обновлен за {(time.perf_counter() - started) * 1000:.0f}ms")
+        delay = token.expires_at / 1000 - time.time() - TOKEN_REFRESH_MARGIN
+    except Exception as e:
+        logger.error(f"Ошибка обновления токена GigaChat: {e}")
+        delay = TOKEN_RETRY_DELAY
+    return max(delay, TOKEN_RETRY_DELAY)
+
+
+async def refresh_giga_token(delay):
+    """Заранее обновляет токен доступа GigaChat, чтобы клиенты не ждали OAuth"""
+    while True:
+        await asyncio.sleep(delay)
+        delay = await update_giga_token()
+
+
+async def on_startup(app):
+    """Получает первый токен GigaChat и запускает фоновые задачи бота"""
+    global token_task
+    delay = await update_giga_token()
+    token_task = asyncio.create_task(refresh_giga_token(delay))
+
+
+async def on_shutdown(app):
+    """Останавливает фоновые задачи и закрывает клиент GigaChat"""
+    if token_task is not None:
+        token_task.cancel()
+    if giga is not None:
+        await giga.aclose()
+
+
 # --- Клавиатуры ---
 def get_consent_keyboard():
     keyboard = [
@@ -104,6 +182,8 @@ def clear_user_data(user_id):
         }
     if user_id in user_states:
         user_states[user_id] = {}
+    if user_id in user_dialogs:
+        del user_dialogs[user_id]
 
 
 async def send_to_manager(user_id, user_name):
@@ -136,6 +216,41 @@ async def send_to_manager(user_id, user_name):
         return False
 
 
+async def get_giga_response(user_id, user_message):
+    """Получает ответ от GigaChat"""
+    from gigachat.context import session_id_cvar
+
+    # Системный промт добавляется один раз при создании диалога
+    if user_id not in user_dialogs:
+        user_dialogs[user_id] = {
+            "session_id": uuid.uuid4().hex,
+            "messages": [{"role": "system", "content": SYSTEM_PROMPT}]
+        }
+
+    dialog = user_dialogs[user_id]
+    messages = dialog["messages"]
+    messages.append({"role": "user", "content": user_message})
+    del messages[1:-DIALOG_HISTORY_LIMIT]
+
+    # Сессия позволяет GigaChat кэшировать начало диалога
+    session_token = session_id_cvar.set(dialog["session_id"])
+    started = time.perf_counter()
+    try:
+        response = await get_giga().achat({"messages": messages})
+        answer = response.choices[0].message.content
+        messages.append({"role": "assistant", "content": answer})
+        return answer
+
+    except Exception as e:
+        messages.pop()
+        logger.error(f"Ошибка GigaChat: {e}")
+        return "Ошибка при обработке запроса. Попробуйте позже."
+
+    finally:
+        session_id_cvar.reset(session_token)
+        logger.info(f"GigaChat для пользователя {user_id}: {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка команды /start"""
     user_id = update.message.chat.id
@@ -247,8 +362,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_message = update.message.text
     user_state = user_states.get(user_id, {})
 
-    status_msg = await update.message.reply_text("⏳ Сохраняю информацию...")
-
     try:
         current_step = user_state.get("step")
 
@@ -257,7 +370,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             update_user_data(user_id, "address", user_message)
             user_states[user_id] = {"step": "gas_amount", "service": user_state.get("service", "")}
 
-            await status_msg.edit_text(
+            await update.message.reply_text(
                 "✅ Адрес сохранен!\n\n"
                 "⚡ Шаг 2 из 3: Укажите необходимое количество газа:\n"
                 "• Для газгольдера: сколько литров нужно заправить\n"
@@ -270,7 +383,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             update_user_data(user_id, "gas_amount", user_message)
             user_states[user_id] = {"step": "phone", "service": user_state.get("service", "")}
 
-            await status_msg.edit_text(
+            await update.message.reply_text(
                 "✅ Количество газа сохранено!\n\n"
                 "📞 Шаг 3 из 3: Укажите ваш контактный телефон:\n"
                 "• Номер для связи\n"
@@ -284,30 +397,41 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             summary = get_user_data_summary(user_id)
 
-            await status_msg.edit_text(
+            await update.message.reply_text(
                 f"{summary}\n\n"
                 "Проверьте правильность данных и отправьте заявку менеджеру:",
                 reply_markup=get_confirmation_keyboard()
             )
 
         else:
-            # Для других сообщений - подсказка
-            await status_msg.edit_text(
-                "Для начала работы отправьте команду /start\n"
-                "Я помогу оформить заявку на доставку газа."
-            )
+            # Для других сообщений используем GigaChat
+            response_text = await answer_free_text(update.message.chat, user_id, user_message, get_giga_response)
+            if response_text is not None:
+                await update.message.reply_text(response_text)
 
     except Exception as e:
         logger.error(f"Ошибка: {e}")
-        await status_msg.edit_text("❌ Ошибка обработки. Попробуйте позже.")
+        await update.message.reply_text("❌ Ошибка обработки. Попробуйте позже.")
 
 
-def main():
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+def build_app():
+    """Создает приложение Telegram и регистрирует обработчики"""
+    app = build_application(
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(True)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CallbackQueryHandler(handle_button_click))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return app
+
+
+def main():
+    app = build_app()
 
     print("✅ Бот-сборщик заявок запущен!")
     print("⚠️  Не забудьте установить MANAGER_CHAT_ID для отправки уведомлений")
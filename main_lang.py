@@ -1,16 +1,24 @@
 import logging  # Импорт стандартного модуля для логирования событий и ошибок в приложении
 from telegram import Update  # Импорт класса Update для получения информации об обновлениях Telegram
 from telegram.ext import ApplicationBuilder, MessageHandler, CommandHandler, filters, ContextTypes  # Импорт инструментов для создания и управления Telegram-ботом
-from openai import OpenAI  # Импортируем OpenAI для работы с их API
 
-from src import *  # Импорт всех настроек, включая токены и ключи, из локального файла настроек
+from traffic import build_application  # Сборка приложения с учетом записи трафика
+from src import OPENAI_API_KEY, TELEGRAM_TOKEN  # Импорт только нужных настроек из локального файла настроек
 
 # --- Логирование ---
 logging.basicConfig(level=logging.INFO)  # Устанавливаем базовый уровень логирования — INFO
 logger = logging.getLogger(__name__)  # Получаем объект логгера для текущего модуля
 
 # --- Инициализация клиента OpenAI ---
-client = OpenAI(api_key=OPENAI_API_KEY)  # Инициализируем клиент OpenAI с помощью API-ключа
+client = None  # Клиент создается при первом запросе к модели
+
+def get_client():
+    """Возвращает клиент OpenAI, импортируя SDK при первом вызове."""
+    global client  # Сохраняем клиент в глобальной переменной модуля
+    if client is None:
+        from openai import OpenAI  # Импортируем OpenAI только когда он действительно нужен
+        client = OpenAI(api_key=OPENAI_API_KEY)  # Инициализируем клиент OpenAI с помощью API-ключа
+    return client
 
 # --- Приветствие ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -35,7 +43,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- Функция запроса к OpenAI ---
 def get_openai_response(user_input: str) -> str:
     """Возвращает ответ модели GPT-4o через Responses API."""
-    response = client.responses.create(
+    response = get_client().responses.create(
         model="gpt-4o-mini",  # Используем модель GPT-4o-mini для генерации ответа
         input=[
             {"role": "system", "content": """
@@ -92,10 +100,14 @@ def get_openai_response(user_input: str) -> str:
     )
     return response.output_text  # Возвращаем полученный от модели текст
 
-def main():
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()  # Создаём объект приложения Telegram-бота с заданным токеном
+def build_app():
+    app = build_application(ApplicationBuilder().token(TELEGRAM_TOKEN))  # Создаём объект приложения Telegram-бота с заданным токеном
     app.add_handler(CommandHandler("start", start))  # Добавляем обработчик команды /start
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))  # Добавляем обработчик обычных текстовых сообщений
+    return app  # Возвращаем готовое приложение
+
+def main():
+    app = build_app()  # Создаём приложение с обработчиками
 
     print("✅ Бот запущен!")  # Печатаем сообщение о запуске бота в консоль
     app.run_polling()  # Запускаем polling и начинаем ожидание новых сообщений
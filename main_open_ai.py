@@ -1,25 +1,52 @@
+import asyncio
 import logging
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, MessageHandler, CommandHandler, filters, ContextTypes, CallbackQueryHandler
-from openai import OpenAI
 
+from llm_limits import answer_free_text
 from src import OPENAI_API_KEY, ASSISTANT_ID, TELEGRAM_TOKEN
+from traffic import build_application
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Инициализация клиента OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Клиент OpenAI создается при первом обращении к ассистенту
+client = None
 
 # Хранилище данных пользователей
 user_states = {}
 user_data = {}  # Для хранения собранных данных
 user_threads = {}  # Для хранения тредов OpenAI
+user_activity = {}  # Время последнего обращения пользователя
+orphan_threads = []  # Треды OpenAI, которые больше не нужны и ждут удаления
+active_threads = set()  # Треды, в которых сейчас выполняется запуск ассистента
+thread_failures = {}  # Сколько раз не удалось удалить тред
+reaper_task = None  # Фоновая задача очистки сессий
+
+# Очистка неактивных сессий
+SESSION_TTL = 24 * 60 * 60  # Через сколько секунд бездействия сессия удаляется
+REAPER_INTERVAL = 10 * 60  # Как часто проверять сессии (в секундах)
+REAPER_BATCH_SIZE = 10  # Сколько тредов удалять одновременно
+REAPER_BATCH_PAUSE = 1.0  # Пауза между пачками удалений (в секундах)
+REAPER_MAX_RETRIES = 5  # Сколько раз пробовать удалить тред, прежде чем отказаться
+
+# Пауза между проверками статуса запуска ассистента (в секундах)
+RUN_POLL_INTERVAL = 0.5
 
 # ID менеджера для уведомлений (замените на реальный ID)
 MANAGER_CHAT_ID = 1791945909
 
 
+def get_client():
+    """Возвращает клиент OpenAI, импортируя SDK при первом вызове"""
+    global client
+    if client is None:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return client
+
+
 # --- Клавиатуры ---
 def get_consent_keyboard():
     keyboard = [
@@ -89,7 +116,116 @@ def clear_user_data(user_id):
     if user_id in user_states:
         user_states[user_id] = {}
     if user_id in user_threads:
-        del user_threads[user_id]
+        # Тред на стороне OpenAI удалит фоновая очистка
+        orphan_threads.append(user_threads.pop(user_id))
+
+
+def touch_session(user_id):
+    """Отмечает время последнего обращения пользователя"""
+    user_activity[user_id] = time.monotonic()
+
+
+def collect_idle_sessions():
+    """Освобождает данные неактивных пользователей и возвращает их треды"""
+    deadline = time.monotonic() - SESSION_TTL
+    idle_users = [user_id for user_id, last_seen in user_activity.items() if last_seen < deadline]
+
+    candidates = orphan_threads[:]
+    orphan_threads.clear()
+    for user_id in idle_users:
+        del user_activity[user_id]
+        user_states.pop(user_id, None)
+        user_data.pop(user_id, None)
+        if user_id in user_threads:
+            candidates.append(user_threads.pop(user_id))
+
+    # Треды с незавершенным запуском удалим в следующий раз, когда ответ будет получен
+    thread_ids = []
+    for thread_id in candidates:
+        if thread_id in active_threads:
+            orphan_threads.append(thread_id)
+        else:
+            thread_ids.append(thread_id)
+    return idle_users, thread_ids
+
+
+async def delete_thread(thread_id):
+    """Удаляет тред OpenAI, возвращает True при успехе"""
+    try:
+        await get_client().beta.threads.delete(thread_id)
+        return True
+    except Exception as e:
+        if getattr(e, "status_code", None) == 404:
+            return True
+        failures = thread_failures.get(thread_id, 0) + 1
+        if failures >= REAPER_MAX_RETRIES:
+            # Например, 401/403: повторять бесполезно
+            logger.error(f"Тред {thread_id} не удален после {failures} попыток, пропускаем: {e}")
+        else:
+            logger.warning(f"Не удалось удалить тред {thread_id}: {e}")
+            thread_failures[thread_id] = failures
+            orphan_threads.append(thread_id)  # Повторим в следующий раз
+        return False
+
+    finally:
+        if thread_id not in orphan_threads:
+            thread_failures.pop(thread_id, None)
+
+
+async def delete_threads(thread_ids):
+    """Удаляет треды пачками с паузами, возвращает число удаленных"""
+    deleted = 0
+    for i in range(0, len(thread_ids), REAPER_BATCH_SIZE):
+        if i:
+            await asyncio.sleep(REAPER_BATCH_PAUSE)
+        batch = thread_ids[i:i + REAPER_BATCH_SIZE]
+        results = await asyncio.gather(*(delete_thread(thread_id) for thread_id in batch))
+        deleted += sum(results)
+    return deleted
+
+
+async def reap_sessions():
+    """Периодически удаляет неактивные сессии и их треды OpenAI"""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            started = time.perf_counter()
+            idle_users, thread_ids = collect_idle_sessions()
+
+            deleted = await delete_threads(thread_ids)
+
+            if idle_users or thread_ids:
+                logger.info(
+                    f"Очистка сессий за {time.perf_counter() - started:.1f}s: "
+                    f"сессий {len(idle_users)}, тредов удалено {deleted} из {len(thread_ids)}, "
+                    f"активных сессий {len(user_activity)}"
+                )
+        except Exception as e:
+            logger.error(f"Ошибка очистки сессий: {e}")
+
+
+async def on_startup(app):
+    """Запускает фоновые задачи бота"""
+    global reaper_task
+    reaper_task = asyncio.create_task(reap_sessions())
+
+
+async def on_shutdown(app):
+    """Останавливает фоновые задачи и удаляет треды, которые после перезапуска станут недоступны"""
+    if reaper_task is not None:
+        reaper_task.cancel()
+
+    # Связи пользователей с тредами хранятся только в памяти, после остановки их не восстановить
+    thread_ids = orphan_threads[:] + list(user_threads.values())
+    orphan_threads.clear()
+    user_threads.clear()
+    if not thread_ids:
+        return
+
+    deleted = await delete_threads(thread_ids)
+    logger.info(f"Остановка: удалено тредов {deleted} из {len(thread_ids)}")
+    if orphan_threads:
+        logger.warning(f"Остановка: не удалось удалить тредов {len(orphan_threads)}, они останутся у OpenAI")
 
 
 async def send_to_manager(user_id, user_name, context: ContextTypes.DEFAULT_TYPE):
@@ -130,36 +266,41 @@ async def send_to_manager(user_id, user_name, context: ContextTypes.DEFAULT_TYPE
 
 async def get_assistant_response(user_id, user_message):
     """Получает ответ от ассистента OpenAI"""
+    thread_id = None
     try:
+        client = get_client()
+
         # Создаем или получаем тред пользователя
         if user_id not in user_threads:
-            thread = client.beta.threads.create()
+            thread = await client.beta.threads.create()
             user_threads[user_id] = thread.id
 
         thread_id = user_threads[user_id]
+        active_threads.add(thread_id)
 
         # Отправляем сообщение пользователя в тред
-        client.beta.threads.messages.create(
+        await client.beta.threads.messages.create(
             thread_id=thread_id,
             role="user",
             content=user_message
         )
 
         # Запускаем ассистента
-        run = client.beta.threads.runs.create(
+        run = await client.beta.threads.runs.create(
             thread_id=thread_id,
             assistant_id=ASSISTANT_ID
         )
 
         # Ожидаем завершения обработки
         while run.status in ("queued", "in_progress"):
-            run = client.beta.threads.runs.retrieve(
+            await asyncio.sleep(RUN_POLL_INTERVAL)
+            run = await client.beta.threads.runs.retrieve(
                 thread_id=thread_id,
                 run_id=run.id
             )
 
         # Получаем ответ ассистента
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
+        messages = await client.beta.threads.messages.list(thread_id=thread_id)
         response_texts = [
             msg.content[0].text.value
             for msg in reversed(messages.data)
@@ -172,6 +313,9 @@ async def get_assistant_response(user_id, user_message):
         logger.error(f"Ошибка OpenAI: {e}")
         return "Ошибка при обработке запроса. Попробуйте позже."
 
+    finally:
+        active_threads.discard(thread_id)
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка команды /start"""
@@ -180,6 +324,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Сбрасываем состояние и данные пользователя
     clear_user_data(user_id)
+    touch_session(user_id)
     user_states[user_id] = {"step": "consent"}
 
     welcome_text = f"""
@@ -204,9 +349,22 @@ async def handle_button_click(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = query.message.chat.id
     user_name = query.message.chat.first_name
     data = query.data
+    touch_session(user_id)
 
     await query.answer()
 
+    # Сессия могла быть удалена фоновой очисткой, пока на экране оставались кнопки
+    expired = (
+        (data.startswith("service_") and user_id not in user_states)
+        or (data.startswith("confirm_") and user_id not in user_data)
+    )
+    if expired:
+        await query.message.reply_text(
+            "⌛ Время сессии истекло. Отправьте /start, чтобы оформить заявку заново.",
+            reply_markup=None
+        )
+        return
+
     if data == "consent_agree":
         user_states[user_id] = {"step": "service_selection", "consent": True}
 
@@ -270,7 +428,7 @@ async def handle_button_click(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
 
     elif data == "confirm_no":
-        user_states[user_id] = {"step": "address", "service": user_data[user_id].get("service_type", "")}
+        user_states[user_id] = {"step": "address", "service": user_data.get(user_id, {}).get("service_type", "")}
         await query.message.reply_text(
             "Давайте исправим данные. Начнем с адреса:\n\n"
             "📍 Укажите ваш полный адрес:",
@@ -283,8 +441,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.chat.id
     user_message = update.message.text
     user_state = user_states.get(user_id, {})
-
-    status_msg = await update.message.reply_text("⏳ Сохраняю информацию...")
+    touch_session(user_id)
 
     try:
         current_step = user_state.get("step")
@@ -294,7 +451,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             update_user_data(user_id, "address", user_message)
             user_states[user_id] = {"step": "gas_amount", "service": user_state.get("service", "")}
 
-            await status_msg.edit_text(
+            await update.message.reply_text(
                 "✅ Адрес сохранен!\n\n"
                 "⚡ Шаг 2 из 3: Укажите необходимое количество газа:\n"
                 "• Для газгольдера: сколько литров нужно заправить\n"
@@ -307,7 +464,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             update_user_data(user_id, "gas_amount", user_message)
             user_states[user_id] = {"step": "phone", "service": user_state.get("service", "")}
 
-            await status_msg.edit_text(
+            await update.message.reply_text(
                 "✅ Количество газа сохранено!\n\n"
                 "📞 Шаг 3 из 3: Укажите ваш контактный телефон:\n"
                 "• Номер для связи\n"
@@ -321,7 +478,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             summary = get_user_data_summary(user_id)
 
-            await status_msg.edit_text(
+            await update.message.reply_text(
                 f"{summary}\n\n"
                 "Проверьте правильность данных и отправьте заявку менеджеру:",
                 reply_markup=get_confirmation_keyboard()
@@ -329,20 +486,34 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         else:
             # Для других сообщений используем ассистента OpenAI
-            response_text = await get_assistant_response(user_id, user_message)
-            await status_msg.edit_text(response_text)
+            response_text = await answer_free_text(update.message.chat, user_id, user_message, get_assistant_response)
+            if response_text is not None:
+                await update.message.reply_text(response_text)
 
     except Exception as e:
         logger.error(f"Ошибка: {e}")
-        await status_msg.edit_text("❌ Ошибка обработки. Попробуйте позже.")
-
-
-def main():
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+        await update.message.reply_text("❌ Ошибка обработки. Попробуйте позже.")
+
+
+def build_app():
+    """Создает приложение Telegram и регистрирует обработчики"""
+    # Обновления обрабатываются параллельно, чтобы сообщения одного чата можно было объединять
+    app = build_application(
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(True)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CallbackQueryHandler(handle_button_click))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return app
+
+
+def main():
+    app = build_app()
 
     print("✅ Бот-сборщик заявок запущен с OpenAI Assistant!")
     print("⚠️  Не забудьте установить MANAGER_CHAT_ID для отправки уведомлений")
@@ -0,0 +1,77 @@
+import argparse
+import importlib
+import logging
+import sys
+import time
+
+import src
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Доступные боты: модуль и настройки, без которых он не запустится
+BACKENDS = {
+    "openai": ("main_open_ai", ("TELEGRAM_TOKEN", "OPENAI_API_KEY", "ASSISTANT_ID")),
+    "giga": ("main_giga", ("TELEGRAM_TOKEN", "GIGACHAT_CREDENTIALS")),
+    "cards": ("main_lang", ("TELEGRAM_TOKEN", "OPENAI_API_KEY")),
+}
+
+
+def get_max_rss_mb():
+    """Возвращает пиковый объем памяти процесса в МБ (если доступно)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux значение в КБ, в macOS — в байтах
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m osnova", description="Запуск бота «ОСНОВА-РЕСУРС»")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), required=True, help="какой бот запустить")
+    parser.add_argument("--check", action="store_true", help="проверить настройки и запуск без polling")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    module_name, required = BACKENDS[args.backend]
+    timings = []
+    started = time.perf_counter()
+
+    # Читаем .env и проверяем настройки до импорта тяжелых библиотек
+    phase = time.perf_counter()
+    src.load_config()
+    missing = src.missing_settings(required)
+    timings.append(("config", time.perf_counter() - phase))
+    if missing:
+        logger.error(f"Не заполнены настройки для '{args.backend}': {', '.join(missing)}")
+        return 1
+
+    phase = time.perf_counter()
+    bot = importlib.import_module(module_name)
+    timings.append(("import", time.perf_counter() - phase))
+
+    phase = time.perf_counter()
+    app = bot.build_app()
+    timings.append(("build_app", time.perf_counter() - phase))
+
+    report = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings)
+    rss = get_max_rss_mb()
+    logger.info(
+        f"Запуск '{args.backend}' за {(time.perf_counter() - started) * 1000:.1f}ms ({report})"
+        + (f", память {rss:.1f}MB" if rss is not None else "")
+    )
+
+    if args.check:
+        return 0
+
+    print(f"✅ Бот '{args.backend}' запущен!")
+    app.run_polling()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
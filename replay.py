@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Боты, трафик которых можно воспроизвести
+BACKENDS = {
+    "openai": "main_open_ai",
+    "giga": "main_giga",
+}
+
+FAKE_TOKEN = "123456:REPLAY"
+
+# Задержки фейковых серверов, если в записи нет замеров (в секундах)
+DEFAULT_TELEGRAM_LATENCY = 0.0
+DEFAULT_LLM_LATENCY = 0.5
+
+
+class FakeServers:
+    """Локальные фейковые Bot API, OpenAI Assistants и GigaChat на одном порту.
+
+    Задержка ответа — либо число секунд, либо список замеров из записи,
+    из которого для каждого запроса выбирается случайное значение.
+    """
+
+    def __init__(self, telegram_latency=DEFAULT_TELEGRAM_LATENCY, llm_latency=DEFAULT_LLM_LATENCY, seed=0):
+        self.telegram_latency = telegram_latency
+        self.llm_latency = llm_latency
+        self._random = random.Random(seed)
+        self.telegram_calls = Counter()
+        self.llm_calls = Counter()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def next_id(self):
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def count(self, counter, name):
+        with self._lock:
+            counter[name] += 1
+
+    def wait(self, latency):
+        if isinstance(latency, list):
+            with self._lock:
+                latency = self._random.choice(latency)
+        time.sleep(latency)
+
+    def telegram(self, method, params):
+        self.count(self.telegram_calls, method)
+        self.wait(self.telegram_latency)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "replay", "username": "replay_bot"}
+        if method in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": self.next_id(),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    def openai(self, method, parts):
+        # parts: ["threads"], ["threads", id, "messages"], ["threads", id, "runs", ...]
+        name = f"{method} /{'/'.join(p if i % 2 == 0 else '{id}' for i, p in enumerate(parts))}"
+        self.count(self.llm_calls, name)
+        if method == "DELETE":
+            return {"id": parts[1], "object": "thread.deleted", "deleted": True}
+        if len(parts) == 1:
+            return {"id": f"thread_{self.next_id()}", "object": "thread", "created_at": 0, "metadata": {}}
+        thread_id = parts[1]
+        if parts[2] == "runs":
+            if method == "POST":
+                # Вся длительность ответа ассистента приходится на запуск, дальше он сразу completed
+                self.wait(self.llm_latency)
+            run_id = parts[3] if len(parts) > 3 else f"run_{self.next_id()}"
+            return {"id": run_id, "object": "thread.run", "thread_id": thread_id, "status": "completed"}
+        message = {
+            "id": f"msg_{self.next_id()}",
+            "object": "thread.message",
+            "created_at": 0,
+            "thread_id": thread_id,
+            "role": "assistant",
+            "content": [{"type": "text", "text": {"value": "Ответ ассистента", "annotations": []}}],
+        }
+        if method == "POST":
+            return dict(message, role="user")
+        return {"object": "list", "data": [message], "first_id": message["id"], "last_id": message["id"], "has_more": False}
+
+    def giga(self, path):
+        self.count(self.llm_calls, path)
+        if path.endswith("/oauth"):
+            return {"access_token": "replay", "expires_at": int((time.time() + 30 * 60) * 1000)}
+        self.wait(self.llm_latency)
+        return {
+            "choices": [{"message": {"role": "assistant", "content": "Ответ GigaChat"}, "index": 0, "finish_reason": "stop"}],
+            "created": int(time.time()),
+            "model": "GigaChat",
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            "object": "chat.completion",
+        }
+
+    def _make_handler(self):
+        servers = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def handle_request(self, method):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path = self.path.split("?", 1)[0]
+                if path.startswith("/bot"):
+                    params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+                    result = {"ok": True, "result": servers.telegram(path.rsplit("/", 1)[-1], params)}
+                elif path.startswith("/openai/"):
+                    result = servers.openai(method, path[len("/openai/"):].strip("/").split("/"))
+                else:
+                    result = servers.giga(path)
+
+                data = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def do_DELETE(self):
+                self.handle_request("DELETE")
+
+        return Handler
+
+
+def load_log(path):
+    """Читает запись traffic.py и возвращает обновления, вызовы Bot API и запросы к модели.
+
+    Запуски бота (строки session) выстраиваются друг за другом: t каждого
+    события пересчитывается от начала первой сессии.
+    """
+    updates, calls, llm_calls = [], [], []
+    offset = end = 0.0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event.get("type") == "session":
+                offset = end
+                continue
+            event["t"] = round(event["t"] + offset, 4)
+            end = max(end, event["t"])
+            if event.get("type") == "update":
+                updates.append(event)
+            elif event.get("type") == "call":
+                calls.append(event)
+            elif event.get("type") == "llm":
+                llm_calls.append(event)
+    return updates, calls, llm_calls
+
+
+def latency_summary(latencies):
+    return {
+        "p50": round(percentile(latencies, 0.50), 1),
+        "p90": round(percentile(latencies, 0.90), 1),
+        "p99": round(percentile(latencies, 0.99), 1),
+    }
+
+
+def summarize_calls(calls, llm_calls, orders):
+    """Сводка по вызовам Bot API и модели, записанным в реальной работе бота"""
+    methods = Counter(call["method"] for call in calls)
+    total = sum(count for method, count in methods.items() if method != "getMe")
+    return {
+        "telegram_calls_total": total,
+        "telegram_calls_per_order": round(total / orders, 2) if orders else None,
+        "telegram_calls": dict(methods),
+        "telegram_latency_ms": latency_summary([call["ms"] for call in calls]),
+        "llm_calls_total": len(llm_calls),
+        "llm_latency_ms": latency_summary([call["ms"] for call in llm_calls]),
+    }
+
+
+def pick_latency(value, recorded, default):
+    """Явно заданная задержка, иначе замеры из записи, иначе значение по умолчанию"""
+    if value is not None:
+        return value
+    if recorded:
+        return [event["ms"] / 1000 for event in recorded]
+    return default
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def replay(module_name, events, speed):
+    """Подает обновления в обработчики бота с записанными интервалами"""
+    from telegram import Update
+
+    bot = importlib.import_module(module_name)
+    app = bot.build_app()
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+
+    latencies = []
+
+    async def process(data):
+        started = time.perf_counter()
+        await app.process_update(Update.de_json(data, app.bot))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    tasks = []
+    started = time.monotonic()
+    for event in events:
+        delay = event["t"] / speed - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(process(event["update"])))
+    await asyncio.gather(*tasks)
+    wall = time.monotonic() - started
+
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    await app.shutdown()
+    return latencies, wall
+
+
+def run(args):
+    events, calls, llm_calls = load_log(args.log)
+    servers = FakeServers(
+        pick_latency(args.telegram_latency, calls, DEFAULT_TELEGRAM_LATENCY),
+        pick_latency(args.llm_latency, llm_calls, DEFAULT_LLM_LATENCY),
+        args.seed,
+    )
+    servers.start()
+
+    # Бот будет обращаться только к фейковым серверам
+    os.environ.update(
+        TELEGRAM_TOKEN=FAKE_TOKEN,
+        TELEGRAM_BASE_URL=f"{servers.url}/bot",
+        RECORD_UPDATES="",
+        OPENAI_API_KEY="replay",
+        OPENAI_BASE_URL=f"{servers.url}/openai",
+        ASSISTANT_ID="asst_replay",
+        GIGACHAT_CREDENTIALS="cmVwbGF5",
+        GIGACHAT_BASE_URL=f"{servers.url}/giga/api/v1",
+        GIGACHAT_AUTH_URL=f"{servers.url}/giga/oauth",
+    )
+
+    orders = sum(1 for event in events if event["update"].get("callback_query", {}).get("data") == "confirm_yes")
+    # В stdout выводится только результат, вывод бота (например, заявки менеджеру) уходит в stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        latencies, wall = asyncio.run(replay(BACKENDS[args.backend], events, args.speed))
+    servers.stop()
+
+    telegram_total = sum(count for method, count in servers.telegram_calls.items() if method != "getMe")
+    result = {
+        "backend": args.backend,
+        "speed": args.speed,
+        "updates": len(events),
+        "orders": orders,
+        "wall_s": round(wall, 2),
+        "telegram_latency": "recorded" if isinstance(servers.telegram_latency, list) else servers.telegram_latency,
+        "llm_latency": "recorded" if isinstance(servers.llm_latency, list) else servers.llm_latency,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 1) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 1),
+            "p90": round(percentile(latencies, 0.90), 1),
+            "p99": round(percentile(latencies, 0.99), 1),
+            "max": round(max(latencies, default=0.0), 1),
+        },
+        "telegram_calls_total": telegram_total,
+        "telegram_calls_per_order": round(telegram_total / orders, 2) if orders else None,
+        "telegram_calls": dict(servers.telegram_calls),
+        "llm_calls": dict(servers.llm_calls),
+        # Для сравнения: что бот делал при записи
+        "recorded": summarize_calls(calls, llm_calls, orders),
+    }
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+def flatten(data, prefix=""):
+    """Превращает вложенный результат в плоский словарь числовых метрик"""
+    result = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            result.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            result[name] = value
+    return result
+
+
+def compare(args):
+    with open(args.before, encoding="utf-8") as f:
+        before = flatten(json.load(f))
+    with open(args.after, encoding="utf-8") as f:
+        after = flatten(json.load(f))
+
+    print(f"{'метрика':<40} {'до':>10} {'после':>10} {'изменение':>10}")
+    for name in sorted(set(before) | set(after)):
+        old, new = before.get(name, 0), after.get(name, 0)
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "—"
+        print(f"{name:<40} {old:>10} {new:>10} {change:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="воспроизвести запись на фейковых серверах")
+    run_parser.add_argument("log", help="файл, записанный с RECORD_UPDATES")
+    run_parser.add_argument("--backend", choices=sorted(BACKENDS), required=True)
+    run_parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно записи")
+    run_parser.add_argument("--llm-latency", type=float, help="задержка ответа модели, с (по умолчанию — из записи)")
+    run_parser.add_argument("--telegram-latency", type=float, help="задержка Bot API, с (по умолчанию — из записи)")
+    run_parser.add_argument("--seed", type=int, default=0, help="зерно выбора задержек из записи")
+    run_parser.add_argument("--out", help="куда сохранить результат в JSON")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="сравнить два результата run")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(handler=compare)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,46 @@
 import os  # Импортируем стандартный модуль для работы с операционной системой и переменными окружения
-from dotenv import load_dotenv  # Импортируем функцию для загрузки переменных окружения из файла .env
 
-load_dotenv()  # Загружаем переменные окружения из файла .env в текущую рабочую среду
+# Все настройки, которые можно задать в файле .env
+CONFIG_KEYS = (
+    "OPENAI_API_KEY",  # API-ключ OpenAI
+    "ASSISTANT_ID",  # Идентификатор ассистента OpenAI
+    "TELEGRAM_TOKEN",  # Токен для Telegram-бота
+    "GIGACHAT_CREDENTIALS",  # Учетные данные для GigaChat
+    "LANGFUSE_SECRET_KEY",  # Секретный ключ для сервиса Langfuse
+    "LANGFUSE_PUBLIC_KEY",  # Публичный ключ для сервиса Langfuse
+    "LANGFUSE_HOST",  # Адрес или домен сервиса Langfuse
+    "TELEGRAM_BASE_URL",  # Адрес Bot API (например, локальный фейковый сервер)
+    "RECORD_UPDATES",  # Путь к файлу для записи трафика бота
+)
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # Получаем значение переменной окружения с API-ключом OpenAI
-ASSISTANT_ID = os.getenv("ASSISTANT_ID")  # Получаем идентификатор ассистента OpenAI
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")  # Получаем токен для Telegram-бота
-GIGACHAT_CREDENTIALS = os.getenv("GIGACHAT_CREDENTIALS")  # Получаем учетные данные для GigaChat
-LANGFUSE_SECRET_KEY = os.getenv("LANGFUSE_SECRET_KEY")  # Получаем секретный ключ для сервиса Langfuse
-LANGFUSE_PUBLIC_KEY = os.getenv("LANGFUSE_PUBLIC_KEY")  # Получаем публичный ключ для сервиса Langfuse
-LANGFUSE_HOST = os.getenv("LANGFUSE_HOST")  # Получаем адрес или домен сервиса Langfuse
\ No newline at end of file
+__all__ = ["CONFIG_KEYS", "load_config", "get_setting", "missing_settings", *CONFIG_KEYS]
+
+_config_loaded = False  # Флаг: файл .env уже прочитан
+
+
+def load_config():
+    """Загружает переменные окружения из файла .env (только один раз)"""
+    global _config_loaded
+    if not _config_loaded:
+        from dotenv import load_dotenv  # Импортируем только когда настройки действительно нужны
+        load_dotenv()
+        _config_loaded = True
+
+
+def get_setting(name):
+    """Возвращает значение настройки по имени"""
+    load_config()
+    return os.getenv(name)
+
+
+def missing_settings(names):
+    """Возвращает список незаполненных настроек из переданных"""
+    return [name for name in names if not get_setting(name)]
+
+
+def __getattr__(name):
+    # Настройки читаются при первом обращении: `from src import TELEGRAM_TOKEN`
+    # загружает .env и берет только ту переменную, которая нужна боту
+    if name in CONFIG_KEYS:
+        return get_setting(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
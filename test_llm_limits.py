@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+import llm_limits
+import typing_status
+from llm_limits import BUSY_TEXT, ChatCoalescer, LLMGate, answer_free_text
+
+
+class FakeChat:
+    """Чат Telegram, который запоминает отправленные статусы"""
+
+    def __init__(self):
+        self.actions = []
+
+    async def send_action(self, action):
+        self.actions.append(action)
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(llm_limits, "llm_gate", LLMGate(max_active=1, max_waiting=0))
+    monkeypatch.setattr(llm_limits, "llm_coalescer", ChatCoalescer(window=0.3))
+    monkeypatch.setattr(typing_status, "TYPING_DELAY", 0.2)
+
+
+def answer_after(delay, calls=None):
+    async def ask_llm(user_id, text):
+        if calls is not None:
+            calls.append(text)
+        await asyncio.sleep(delay)
+        return f"ответ: {text}"
+
+    return ask_llm
+
+
+def test_fast_answer_sends_no_chat_action():
+    # Окно объединения длиннее TYPING_DELAY, но сам ответ модели быстрый
+    chat = FakeChat()
+    answer = asyncio.run(answer_free_text(chat, 1, "вопрос", answer_after(0.05)))
+
+    assert answer == "ответ: вопрос"
+    assert chat.actions == []
+
+
+def test_slow_answer_shows_typing():
+    chat = FakeChat()
+    asyncio.run(answer_free_text(chat, 1, "вопрос", answer_after(0.4)))
+
+    assert len(chat.actions) == 1
+
+
+def test_quick_messages_are_merged_into_one_call():
+    calls = []
+    ask_llm = answer_after(0.05, calls)
+
+    async def scenario():
+        chat = FakeChat()
+        first = asyncio.create_task(answer_free_text(chat, 1, "раз", ask_llm))
+        await asyncio.sleep(0.1)
+        second = await answer_free_text(chat, 1, "два", ask_llm)
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert calls == ["раз\nдва"]
+    assert first == "ответ: раз\nдва"
+    assert second is None
+
+
+def test_busy_reply_does_not_wait_for_debounce():
+    async def scenario():
+        busy_chat = asyncio.create_task(answer_free_text(FakeChat(), 1, "долгий вопрос", answer_after(1.0)))
+        await asyncio.sleep(0.4)  # Первый запрос занял единственное место у модели
+
+        started = time.perf_counter()
+        answer = await answer_free_text(FakeChat(), 2, "вопрос", answer_after(0.05))
+        elapsed = time.perf_counter() - started
+        busy_chat.cancel()
+        return answer, elapsed
+
+    answer, elapsed = asyncio.run(scenario())
+
+    assert answer == BUSY_TEXT
+    assert elapsed < llm_limits.llm_coalescer.window
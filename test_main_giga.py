@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import main_giga
+
+
+class GigaStub:
+    """Локальная заглушка OAuth и /chat/completions GigaChat"""
+
+    def __init__(self, token_ttl):
+        self.token_ttl = token_ttl
+        self.auth_calls = []  # (время запроса, expires_at выданного токена в секундах)
+        self.chat_calls = []  # (заголовок Authorization, сообщения запроса)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path.endswith("/oauth"):
+                    expires_at = time.time() + stub.token_ttl
+                    stub.auth_calls.append((time.time(), expires_at))
+                    result = {"access_token": f"token{len(stub.auth_calls)}", "expires_at": int(expires_at * 1000)}
+                else:
+                    messages = json.loads(body)["messages"]
+                    stub.chat_calls.append((self.headers.get("Authorization"), messages))
+                    result = {
+                        "choices": [{"message": {"role": "assistant", "content": "ответ"}, "index": 0, "finish_reason": "stop"}],
+                        "created": 0,
+                        "model": "GigaChat",
+                        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                        "object": "chat.completion",
+                    }
+                data = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = GigaStub(token_ttl=60 * 60)
+    monkeypatch.setenv("GIGACHAT_BASE_URL", f"{stub.url}/api/v1")
+    monkeypatch.setenv("GIGACHAT_AUTH_URL", f"{stub.url}/oauth")
+    monkeypatch.setattr(main_giga, "GIGACHAT_CREDENTIALS", "cmVwbGF5")
+    monkeypatch.setattr(main_giga, "giga", None)
+    monkeypatch.setattr(main_giga, "user_dialogs", {})
+    yield stub
+    stub.server.shutdown()
+
+
+def run_bot(coroutine):
+    """Запускает сценарий между on_startup и on_shutdown бота"""
+    async def scenario():
+        await main_giga.on_startup(None)
+        try:
+            return await coroutine()
+        finally:
+            await main_giga.on_shutdown(None)
+
+    return asyncio.run(scenario())
+
+
+def test_token_is_prefetched_before_first_chat(stub):
+    async def scenario():
+        assert len(stub.auth_calls) == 1
+        assert stub.chat_calls == []
+        await main_giga.get_giga_response(1, "Сколько стоит доставка?")
+
+    run_bot(scenario)
+
+    assert len(stub.auth_calls) == 1
+    assert stub.chat_calls[0][0] == "Bearer token1"
+
+
+def test_token_is_refreshed_before_expiry(stub, monkeypatch):
+    stub.token_ttl = 1.5
+    monkeypatch.setattr(main_giga, "TOKEN_REFRESH_MARGIN", 1.0)
+    monkeypatch.setattr(main_giga, "TOKEN_RETRY_DELAY", 0.1)
+
+    async def scenario():
+        await asyncio.sleep(0.9)
+        await main_giga.get_giga_response(1, "Вопрос")
+
+    run_bot(scenario)
+
+    assert len(stub.auth_calls) >= 2
+    first_expires_at = stub.auth_calls[0][1]
+    assert stub.auth_calls[1][0] < first_expires_at
+    assert stub.chat_calls[0][0] == "Bearer token2"
+
+
+def test_system_prompt_is_sent_once_per_dialog(stub, monkeypatch):
+    monkeypatch.setattr(main_giga, "DIALOG_HISTORY_LIMIT", 4)
+
+    async def scenario():
+        for i in range(5):
+            await main_giga.get_giga_response(1, f"Вопрос {i}")
+
+    run_bot(scenario)
+
+    for _, messages in stub.chat_calls:
+        roles = [message["role"] for message in messages]
+        assert roles[0] == "system"
+        assert roles.count("system") == 1
+        assert messages[0]["content"] == main_giga.SYSTEM_PROMPT
+        assert len(messages) <= main_giga.DIALOG_HISTORY_LIMIT + 1
+    assert stub.chat_calls[-1][1][-1]["content"] == "Вопрос 4"
+    assert main_giga.user_dialogs[1]["messages"][0]["role"] == "system"
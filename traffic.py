@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from telegram import Update
+from telegram.ext import TypeHandler
+from telegram.request import HTTPXRequest
+
+from src import RECORD_UPDATES, TELEGRAM_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+recorder = None  # Рекордер текущего приложения, если запись включена
+
+# Поля с личными данными, которые не попадают в запись
+PERSON_KEYS = ("from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat")
+NAME_KEYS = ("first_name", "last_name", "username", "title")
+DROP_KEYS = ("phone_number", "contact", "location", "venue")
+
+# Кнопки ботов, ID которых записываются как есть
+KNOWN_CALLBACKS = (
+    "consent_agree",
+    "consent_disagree",
+    "service_gasgolder",
+    "service_ags",
+    "confirm_yes",
+    "confirm_no",
+)
+
+
+def mask_text(text):
+    """Заменяет текст заглушкой той же длины и с теми же классами символов"""
+    result = []
+    for char in text:
+        if char.isdigit():
+            result.append("0")
+        elif char.isalpha():
+            cyrillic = "\u0400" <= char <= "\u04ff"
+            letter = "а" if cyrillic else "a"
+            result.append(letter.upper() if char.isupper() else letter)
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def mask_message_text(text):
+    """Обезличивает текст сообщения, оставляя команды вида /start"""
+    if text.startswith("/"):
+        command, separator, rest = text.partition(" ")
+        return command + separator + mask_text(rest)
+    return mask_text(text)
+
+
+class TrafficRecorder:
+    """Пишет входящие обновления и время исходящих вызовов Bot API и модели в JSONL.
+
+    Каждый запуск бота начинается со строки session, t — секунды от ее начала:
+        {"t": 0.0, "type": "session", "started": "2026-10-19T10:00:00+00:00"}
+        {"t": 0.1, "type": "update", "update": {...}}
+        {"t": 0.2, "type": "call", "method": "sendMessage", "ms": 85.3}
+        {"t": 1.9, "type": "llm", "name": "get_giga_response", "ms": 1640.2}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.monotonic()
+        self._salt = os.urandom(8)  # Псевдонимы стабильны только внутри одной записи
+        # Запуски дописываются в один файл, replay.py воспроизводит их по очереди
+        self._file = open(path, "a", encoding="utf-8")
+        self.write({"type": "session", "started": datetime.now(timezone.utc).isoformat(timespec="seconds")})
+        logger.info(f"Запись трафика в {path}")
+
+    def write(self, event):
+        event["t"] = round(time.monotonic() - self.started, 4)
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def pseudonym(self, value):
+        digest = hashlib.sha256(self._salt + str(value).encode()).digest()
+        return int.from_bytes(digest[:4], "big")
+
+    def anonymize(self, data, person=False):
+        """Заменяет ID и имена псевдонимами, а текст — заглушкой"""
+        if isinstance(data, list):
+            return [self.anonymize(item, person) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        for key, value in data.items():
+            if key in DROP_KEYS:
+                continue
+            if person and key == "id":
+                result[key] = self.pseudonym(value)
+            elif person and key in NAME_KEYS:
+                result[key] = key
+            elif key in ("text", "caption") and isinstance(value, str):
+                result[key] = mask_message_text(value)
+            else:
+                result[key] = self.anonymize(value, key in PERSON_KEYS)
+        return result
+
+    async def record_update(self, update: Update, context):
+        data = self.anonymize(update.to_dict())
+
+        callback = data.get("callback_query")
+        if callback:
+            if callback.get("data") not in KNOWN_CALLBACKS:
+                callback["data"] = mask_text(callback.get("data", ""))
+            # Текст сообщения с кнопками — это сводка заявки, для воспроизведения нужны только ID
+            message = callback.get("message")
+            if message:
+                for key in ("text", "entities", "caption", "caption_entities"):
+                    message.pop(key, None)
+
+        self.write({"type": "update", "update": data})
+
+    def record_call(self, method, seconds):
+        self.write({"type": "call", "method": method, "ms": round(seconds * 1000, 1)})
+
+    def record_llm_call(self, name, seconds):
+        self.write({"type": "llm", "name": name, "ms": round(seconds * 1000, 1)})
+
+
+class RecordingRequest(HTTPXRequest):
+    """HTTPXRequest, который сообщает рекордеру время каждого вызова Bot API"""
+
+    def __init__(self, recorder, **kwargs):
+        kwargs.setdefault("connection_pool_size", 256)  # Как у запроса по умолчанию в ApplicationBuilder
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    async def do_request(self, url, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            self.recorder.record_call(url.rsplit("/", 1)[-1], time.perf_counter() - started)
+
+
+def record_llm_call(name, seconds):
+    """Записывает длительность запроса к модели, если запись включена"""
+    if recorder:
+        recorder.record_llm_call(name, seconds)
+
+
+def build_application(builder):
+    """Собирает приложение с учетом TELEGRAM_BASE_URL и RECORD_UPDATES"""
+    global recorder
+    if TELEGRAM_BASE_URL:
+        # Например, локальный фейковый сервер Telegram для replay.py
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+
+    recorder = TrafficRecorder(RECORD_UPDATES) if RECORD_UPDATES else None
+    if recorder:
+        builder = builder.request(RecordingRequest(recorder))
+
+    app = builder.build()
+    if recorder:
+        # Группа -1 выполняется раньше обработчиков бота и не мешает им
+        app.add_handler(TypeHandler(Update, recorder.record_update), group=-1)
+    return app
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+
+from telegram.constants import ChatAction
+
+logger = logging.getLogger(__name__)
+
+# Статус «печатает...» для медленных ответов модели (в секундах)
+TYPING_DELAY = 1.0  # Показываем статус, только если ответ не готов за это время
+TYPING_REPEAT = 4.0  # Telegram сбрасывает статус через 5 секунд
+
+
+async def keep_typing(chat):
+    """Показывает «печатает...», если ответ готовится дольше TYPING_DELAY"""
+    await asyncio.sleep(TYPING_DELAY)
+    while True:
+        try:
+            await chat.send_action(ChatAction.TYPING)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить статус набора: {e}")
+        await asyncio.sleep(TYPING_REPEAT)
+
+
+async def reply_with_typing(chat, coroutine):
+    """Ожидает медленный ответ, показывая статус набора только при задержке"""
+    typing_task = asyncio.create_task(keep_typing(chat))
+    try:
+        return await coroutine
+    finally:
+        typing_task.cancel()